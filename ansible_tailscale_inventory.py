@@ -23,22 +23,40 @@
 
 from __future__ import annotations
 
+import contextlib
 import json
+import os
 import platform
 import subprocess
 import sys
-from typing import Any, Dict, List, TypedDict, Union
+import tempfile
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TypedDict,
+    Union,
+)
 
 ansible_inventory_type = Dict[str, Dict[str, Union[List[str], Dict[str, Any]]]]
 
+# Select tailscale binary to run based upon OS name. This is resolved once at import,
+# unsupported systems are reported when tailscale status is requested
+system_os_name = platform.system()
+tailscale_cmd = {
+    "Linux": "tailscale",
+    "Darwin": "/Applications/Tailscale.app/Contents/MacOS/Tailscale",
+}.get(system_os_name)
 
-class InventoryType(TypedDict):
-    """
-    Type annotation for internal representation of the inventory
-    """
-
-    metadata: dict[str, dict[str, Any]]  # Maps hostnames to mappings of their hostvars
-    groups: dict[str, list[str]]  # Maps group names to their list of group members
+# Translation table used to turn tailscale tags into ansible compatible group names in a
+# single pass
+ansible_safe_tag_table = str.maketrans({":": "_", "-": "_"})
 
 
 class TailscaleHostType(TypedDict, total=False):
@@ -70,8 +88,8 @@ class TailscaleHostType(TypedDict, total=False):
     PublicKey: str
     Relay: str
     RxBytes: int
-    Tags: list[str]
-    TailscaleIPs: list[str]
+    Tags: list[str] | None
+    TailscaleIPs: list[str] | None
     TxBytes: int
     UserID: int
 
@@ -88,7 +106,7 @@ class TailscaleStatusType(TypedDict):
     CurrentTailnet: dict[str, Any]
     Health: Any
     MagicDNSSuffix: str
-    Peer: dict[str, TailscaleHostType]
+    Peer: dict[str, TailscaleHostType] | None
     Self: TailscaleHostType
     TailscaleIPs: list[str]
     TUN: bool
@@ -96,25 +114,75 @@ class TailscaleStatusType(TypedDict):
     Version: str
 
 
+class TailscaleInventoryHostType(TypedDict, total=False):
+    """
+    Type annotation for the subset of Tailscale host fields used to build the inventory.
+    msgspec evaluates these annotations at runtime, so they use the typing generics to
+    stay compatible with python 3.8
+    """
+
+    DNSName: str
+    HostName: str
+    Online: bool
+    OS: str
+    Tags: Optional[List[str]]  # noqa: UP006, UP045
+    TailscaleIPs: Optional[List[str]]  # noqa: UP006, UP045
+
+
+class TailscaleInventoryStatusType(TypedDict):
+    """
+    Type annotation for the subset of the Tailscale status JSON used to build the
+    inventory. As above, the annotations are evaluated at runtime by msgspec
+    """
+
+    Peer: Optional[Dict[str, TailscaleInventoryHostType]]  # noqa: UP006, UP045
+    Self: TailscaleInventoryHostType
+
+
+# msgspec, pysimdjson and orjson are optional dependencies. When installed they're used
+# to parse the tailscale status output considerably faster than the standard library
+# can. msgspec is preferred because it decodes against a schema of just the fields we
+# use, so nothing else in the status ever becomes a Python object. pysimdjson is next
+# because it parses lazily, so only the fields we read become Python objects. Its
+# documents are only valid while the parser that produced them is alive and hasn't
+# parsed anything else, which is why a single module-level parser is used. Without any
+# of them we fall back to the standard library so the script stays dependency-free
+try:
+    from msgspec import DecodeError
+    from msgspec.json import Decoder
+
+    json_loads: Callable[[bytes], Any] = Decoder(TailscaleInventoryStatusType).decode
+    json_decode_errors: tuple[type[Exception], ...] = (DecodeError,)
+except ImportError:  # pragma: no cover
+    # orjson and the standard library raise a ValueError subclass for output they can't
+    # parse. pysimdjson raises RuntimeError for some of its errors as well
+    json_decode_errors = (ValueError,)
+    try:
+        from simdjson import Parser
+
+        json_loads = Parser().parse
+        json_decode_errors = (ValueError, RuntimeError)
+    except ImportError:
+        try:
+            from orjson import loads as json_loads
+        except ImportError:
+            from json import loads as json_loads
+
+
 def get_tailscale_status() -> TailscaleStatusType:
     """
     Returns raw status information from the local tailscale install
     """
 
-    # Select tailscale binary to run based upon OS name
-    system_os_name = platform.system()
-    if system_os_name == "Linux":
-        tailscale_cmd = "tailscale"
-    elif system_os_name == "Darwin":
-        tailscale_cmd = "/Applications/Tailscale.app/Contents/MacOS/Tailscale"
-    else:
+    if tailscale_cmd is None:
         print(f"{system_os_name} not currently supported. Contributions welcome!")
         sys.exit(1)
 
     try:
         tailscale_proc = subprocess.run(  # noqa: S603
             [tailscale_cmd, "status", "--self", "--json"],
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             check=True,
         )
     except FileNotFoundError as e:
@@ -124,7 +192,11 @@ def get_tailscale_status() -> TailscaleStatusType:
         print(f"tailscale command failed. Is tailscale running?: {e}")
         sys.exit(1)
 
-    tailscale_output_json: TailscaleStatusType = json.loads(tailscale_proc.stdout)
+    try:
+        tailscale_output_json: TailscaleStatusType = json_loads(tailscale_proc.stdout)
+    except json_decode_errors as e:
+        print(f"tailscale status output could not be parsed: {e}")
+        sys.exit(1)
     return tailscale_output_json
 
 
@@ -136,50 +208,88 @@ def assemble_all_tailscale_hosts(
     the "self" host
     """
 
-    all_hosts: list[TailscaleHostType] = list(ts_status["Peer"].values())
+    # Tailscale reports a null Peer when there are no other nodes in the tailnet
+    peers = ts_status["Peer"] or {}
+
+    # Lazily parsed pysimdjson documents would materialize every field of every peer
+    # through values(), so their peers are looked up by key instead
+    all_hosts: list[TailscaleHostType]
+    if isinstance(peers, dict):
+        all_hosts = list(peers.values())
+    else:
+        all_hosts = [peers[peer_id] for peer_id in peers]
     all_hosts.append(ts_status["Self"])
     return all_hosts
 
 
-def assemble_inventory(
-    tailscale_hosts: list[TailscaleHostType],
-    tailscale_self_hostname: str,
-) -> InventoryType:
-    """
-    Given a list of tailscale hosts with their metadata return an inventory object. This
-    is where we select set the metadata ansible will be aware of for each host as
-    hostvars, and defines group memberships. The "self" hostname needs to be identified
-    explicitly so it can be put into its own group
-    """
-
-    # Create the base inventory data structure
-    inventory: InventoryType = {
-        "metadata": {},
-        "groups": {
-            "all": [],
-            "online": [],
-            "offline": [],
-            "self": [tailscale_self_hostname],
-        },
-    }
+def iter_inventory_hosts(
+    tailscale_hosts: Iterable[TailscaleHostType],
+) -> Iterator[tuple[TailscaleHostType, str, str]]:
+    """
+    Given tailscale hosts with their metadata, yields each host that belongs in the
+    inventory along with its hostname and OS, so those fields only need to be read once
+    """
 
     for host_data in tailscale_hosts:
+        hostname = host_data["HostName"]
+
         # We intentionally avoid adding any the funnel-ingress-node to the inventory
         # because we can't manage it
-        if host_data["HostName"] == "funnel-ingress-node":
+        if hostname == "funnel-ingress-node":
             continue
 
         # We ignore endpoints that have no OS, like Mullvad exit nodes
-        if not host_data["OS"]:
+        os_name = host_data["OS"]
+        if not os_name:
             continue
 
-        # We add each host to the list of all hosts
-        inventory["groups"]["all"].append(host_data["HostName"])
+        yield host_data, hostname, os_name
+
+
+def assemble_inventory(
+    tailscale_hosts: list[TailscaleHostType],
+    tailscale_self_hostname: str,
+) -> ansible_inventory_type:
+    """
+    Given a list of tailscale hosts with their metadata return an ansible inventory
+    object. This is where we select set the metadata ansible will be aware of for each
+    host as hostvars, and defines group memberships. The "self" hostname needs to be
+    identified explicitly so it can be put into its own group
+    """
+
+    # Create the base inventory data structure. The groups mapping holds the same host
+    # lists that are placed in the inventory, so groups are built up in place
+    hostvars: dict[str, dict[str, Any]] = {}
+    all_group: list[str] = []
+    online_group: list[str] = []
+    offline_group: list[str] = []
+    self_group = [tailscale_self_hostname]
+    groups: dict[str, list[str]] = {
+        "all": all_group,
+        "online": online_group,
+        "offline": offline_group,
+        "self": self_group,
+    }
+    inventory: ansible_inventory_type = {
+        "_meta": {"hostvars": hostvars},
+        "all": {"hosts": all_group},
+        "online": {"hosts": online_group},
+        "offline": {"hosts": offline_group},
+        "self": {"hosts": self_group},
+    }
 
-        # Set host's inventory metadata
-        inventory["metadata"][host_data["HostName"]] = {
+    for host_data, hostname, os_name in iter_inventory_hosts(tailscale_hosts):
+        # We add each host to the list of all hosts
+        all_group.append(hostname)
+
+        # Set host's inventory metadata. Lazily parsed pysimdjson arrays are copied into
+        # lists so the inventory can be serialized
+        tailscale_ips = host_data["TailscaleIPs"] or []
+        if not isinstance(tailscale_ips, list):
+            tailscale_ips = list(tailscale_ips)
+        hostvars[hostname] = {
             "ansible_host": host_data["DNSName"],
-            "tailscale_ips": host_data["TailscaleIPs"],
+            "tailscale_ips": tailscale_ips,
         }
 
         # Hosts that are offline will still be present in the inventory. We set-up these
@@ -187,66 +297,185 @@ def assemble_inventory(
         # offline hosts entirely but there may be use cases where one does want to see
         # an error if they attempt to connect to an offline host
         if host_data["Online"]:
-            inventory["groups"]["online"].append(host_data["HostName"])
+            online_group.append(hostname)
         else:
-            inventory["groups"]["offline"].append(host_data["HostName"])
+            offline_group.append(hostname)
 
         # If we encounter an OS type we don't have in the inventory yet, we create a
         # group for it, then we always add each host to the group for that OS
-        if host_data["OS"] not in inventory["groups"]:
-            inventory["groups"][host_data["OS"]] = []
-        inventory["groups"][host_data["OS"]].append(host_data["HostName"])
+        os_group = groups.get(os_name)
+        if os_group is None:
+            os_group = groups[os_name] = []
+            inventory[os_name] = {"hosts": os_group}
+        os_group.append(hostname)
 
         # We create groups for host tags. Tag names have to be modified to be compatible
-        # with ansible
-        if "Tags" in host_data:
-            for tag in host_data["Tags"]:
-                safe_tag = tag.replace(":", "_").replace("-", "_")
-                if safe_tag in inventory["groups"]:
-                    inventory["groups"][safe_tag].append(host_data["HostName"])
-                else:
-                    inventory["groups"][safe_tag] = [host_data["HostName"]]
+        # with ansible. Untagged hosts have no Tags
+        for tag in host_data.get("Tags") or ():
+            safe_tag = tag.translate(ansible_safe_tag_table)
+            tag_group = groups.get(safe_tag)
+            if tag_group is None:
+                tag_group = groups[safe_tag] = []
+                inventory[safe_tag] = {"hosts": tag_group}
+            tag_group.append(hostname)
 
     return inventory
 
 
-def format_ansible_inventory(inventory: InventoryType) -> ansible_inventory_type:
+def tailscale_status_to_ansible_inventory(
+    ts_status: TailscaleStatusType,
+) -> ansible_inventory_type:
     """
-    Given an inventory object, returns the inventory formatted to be read by ansible
+    Given a tailscale status object this returns an ansible inventory object
     """
 
-    # Create the base ansible inventory object
-    ansible_inventory: ansible_inventory_type = {
-        "_meta": {"hostvars": inventory["metadata"]},
-    }
+    ts_all_hosts = assemble_all_tailscale_hosts(ts_status)
+    return assemble_inventory(ts_all_hosts, ts_status["Self"]["HostName"])
 
-    # Create groups
-    for key, value in inventory["groups"].items():
-        ansible_inventory[key] = {"hosts": value}
 
-    return ansible_inventory
+def json_dump_ansible_inventory(
+    ansible_inventory: ansible_inventory_type,
+    *,
+    pretty: bool = False,
+) -> bytes:
+    """
+    Returns the ansible inventory serialized as compact JSON bytes, or indented with
+    sorted keys when pretty is set. Non-ASCII characters are written as UTF-8 rather
+    than escaped, matching orjson's output
+    """
 
+    if pretty:
+        inventory_json = json.dumps(
+            ansible_inventory, ensure_ascii=False, indent=2, sort_keys=True
+        )
+    else:
+        inventory_json = json.dumps(
+            ansible_inventory, ensure_ascii=False, separators=(",", ":")
+        )
+    return inventory_json.encode()
 
-def tailscale_status_to_ansible_inventory(
-    ts_status: TailscaleStatusType,
-) -> ansible_inventory_type:
+
+# As with parsing, orjson is used to serialize the inventory when it is available
+try:
+    from orjson import OPT_INDENT_2, OPT_SORT_KEYS
+    from orjson import dumps as orjson_dumps
+
+    def orjson_dump_ansible_inventory(
+        ansible_inventory: ansible_inventory_type,
+        *,
+        pretty: bool = False,
+    ) -> bytes:
+        """
+        Returns the ansible inventory serialized with orjson, in the same formats as
+        json_dump_ansible_inventory
+        """
+
+        option = OPT_INDENT_2 | OPT_SORT_KEYS if pretty else None
+        return orjson_dumps(ansible_inventory, option=option)
+
+    dump_ansible_inventory = orjson_dump_ansible_inventory
+except ImportError:  # pragma: no cover
+    dump_ansible_inventory = json_dump_ansible_inventory
+
+
+def get_inventory_cache_ttl() -> float:
     """
-    Given a tailscale status object this returns an ansible inventory object
+    Returns how many seconds a cached inventory stays valid for, as set by the
+    TAILSCALE_INV_TTL environment variable. A TTL of 0 disables the cache
     """
 
-    ts_all_hosts = assemble_all_tailscale_hosts(ts_status)
-    inventory = assemble_inventory(ts_all_hosts, ts_status["Self"]["HostName"])
-    return format_ansible_inventory(inventory)
+    cache_ttl = os.environ.get("TAILSCALE_INV_TTL", "5")
+    try:
+        return float(cache_ttl)
+    except ValueError:
+        print(f"TAILSCALE_INV_TTL must be a number of seconds, got: {cache_ttl}")
+        sys.exit(1)
+
+
+def get_inventory_cache_path() -> Path | None:
+    """
+    Returns the path the rendered inventory is cached at, or None when there is no
+    cache directory because the home directory can't be determined
+    """
+
+    cache_dir = os.environ.get("XDG_CACHE_HOME")
+    if not cache_dir:
+        try:
+            cache_dir = str(Path.home() / ".cache")
+        except (KeyError, RuntimeError):
+            return None
+    return Path(cache_dir) / "ansible-tailscale-inventory.json"
 
 
+def read_inventory_cache(cache_path: Path, cache_ttl: float) -> bytes | None:
+    """
+    Returns the cached inventory if it was written less than cache_ttl seconds ago,
+    otherwise None. A cache modified in the future, like after clock skew, is treated as
+    stale
+    """
+
+    if cache_ttl <= 0:
+        return None
+
+    with contextlib.suppress(OSError):
+        cache_age = time.time() - cache_path.stat().st_mtime
+        if 0 <= cache_age < cache_ttl:
+            return cache_path.read_bytes()
+    return None
+
+
+def write_inventory_cache(cache_path: Path, inventory_json: bytes) -> None:
+    """
+    Atomically replaces the cached inventory. Failing to write the cache isn't fatal,
+    the inventory just won't be cached
+    """
+
+    with contextlib.suppress(OSError):
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_file = tempfile.NamedTemporaryFile(  # noqa: SIM115
+            dir=cache_path.parent,
+            prefix=f".{cache_path.name}.",
+            delete=False,
+        )
+        temp_path = Path(cache_file.name)
+        try:
+            with cache_file:
+                cache_file.write(inventory_json)
+            temp_path.replace(cache_path)
+        except OSError:
+            temp_path.unlink()
+
+
+# Ansible runs the script with --list and only needs the JSON to be parseable, so the
+# inventory is written as compact JSON by default. Passing --pretty, or setting the
+# TAILSCALE_INV_PRETTY=1 environment variable, writes it indented with sorted keys for
+# people reading it instead
 def main() -> None:
     """
     This is the main function run when the script is executed
     """
 
-    ts_status = get_tailscale_status()
-    ansible_inventory = tailscale_status_to_ansible_inventory(ts_status)
-    print(json.dumps(ansible_inventory, indent=2, sort_keys=True))
+    pretty = "--pretty" in sys.argv[1:] or os.environ.get("TAILSCALE_INV_PRETTY") == "1"
+
+    # Ansible can run the inventory script several times in quick succession, so the
+    # rendered inventory is cached for a few seconds to avoid rerunning tailscale.
+    # Pretty output is meant for people checking the current state, so it always skips
+    # the cache
+    cache_ttl = 0 if pretty else get_inventory_cache_ttl()
+    cache_path = get_inventory_cache_path() if cache_ttl > 0 else None
+    inventory_json = None
+    if cache_path is not None:
+        inventory_json = read_inventory_cache(cache_path, cache_ttl)
+
+    if inventory_json is None:
+        ts_status = get_tailscale_status()
+        ansible_inventory = tailscale_status_to_ansible_inventory(ts_status)
+        inventory_json = dump_ansible_inventory(ansible_inventory, pretty=pretty)
+        inventory_json += b"\n"
+        if cache_path is not None:
+            write_inventory_cache(cache_path, inventory_json)
+
+    sys.stdout.buffer.write(inventory_json)
 
 
 if __name__ == "__main__":
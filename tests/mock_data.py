@@ -128,6 +128,32 @@ mock_tailscale_status_output: TailscaleStatusType = {
             "InMagicSock": True,
             "InEngine": False,
         },
+        "nodekey:4234567891011121314151617181920212223242526272829303132333435abc": {
+            "ID": "dbc1234567DE",
+            "PublicKey": "nodekey:4234567891011121314151617181920212223242526272829303132333435abc",
+            "HostName": "us-nyc-wg-001.mullvad.ts.net",
+            "DNSName": "us-nyc-wg-001.mullvad.ts.net.",
+            "OS": "",
+            "UserID": 423456789101112131,
+            "TailscaleIPs": None,
+            "Addrs": None,
+            "CurAddr": "",
+            "Relay": "",
+            "RxBytes": 0,
+            "TxBytes": 0,
+            "Created": "0001-01-01T00:00:00Z",
+            "LastWrite": "0001-01-01T00:00:00Z",
+            "LastSeen": "0001-01-01T00:00:00Z",
+            "LastHandshake": "0001-01-01T00:00:00Z",
+            "Online": True,
+            "ExitNode": False,
+            "ExitNodeOption": True,
+            "Active": False,
+            "PeerAPIURL": [],
+            "InNetworkMap": True,
+            "InMagicSock": False,
+            "InEngine": False,
+        },
     },
     "User": {
         "123456789101112131": {
@@ -1,13 +1,82 @@
 from __future__ import annotations
 
+import importlib
+import json
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, Any, Callable
+
+import pytest
+
+import ansible_tailscale_inventory
 from ansible_tailscale_inventory import (
+    ansible_inventory_type,
+    json_dump_ansible_inventory,
+    main,
+    read_inventory_cache,
     tailscale_status_to_ansible_inventory,
+    write_inventory_cache,
 )
 from tests.mock_data import (
     expected_ansible_inventory_output,
     mock_tailscale_status_output,
 )
 
+if TYPE_CHECKING:
+    from pathlib import Path
+    from types import ModuleType
+
+    from ansible_tailscale_inventory import TailscaleStatusType
+
+
+def import_optional(module_name: str) -> ModuleType | None:
+    """
+    Returns the named optional dependency, or None when it isn't installed
+    """
+
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        return None
+
+
+def requires(module_name: str) -> pytest.MarkDecorator:
+    """
+    Marks a test parameter to be skipped when the named optional dependency isn't
+    installed
+    """
+
+    return pytest.mark.skipif(
+        import_optional(module_name) is None, reason=f"{module_name} is not installed"
+    )
+
+
+simdjson = import_optional("simdjson")
+orjson = import_optional("orjson")
+
+# msgspec comes first in the script's parser preference, so when it is installed the
+# module's own json_loads is its schema decoder
+json_loads_params = [
+    pytest.param(
+        ansible_tailscale_inventory.json_loads, id="msgspec", marks=requires("msgspec")
+    ),
+    pytest.param(
+        simdjson and simdjson.Parser().parse, id="simdjson", marks=requires("simdjson")
+    ),
+    pytest.param(orjson and orjson.loads, id="orjson", marks=requires("orjson")),
+    pytest.param(json.loads, id="json"),
+]
+
+dump_ansible_inventory_params = [
+    pytest.param(
+        getattr(ansible_tailscale_inventory, "orjson_dump_ansible_inventory", None),
+        id="orjson",
+        marks=requires("orjson"),
+    ),
+    pytest.param(json_dump_ansible_inventory, id="json"),
+]
+
 
 def test_tailscale_status_to_ansible_inventory() -> None:
     """
@@ -19,3 +88,210 @@ def test_tailscale_status_to_ansible_inventory() -> None:
         tailscale_status_to_ansible_inventory(mock_tailscale_status_output)
         == expected_ansible_inventory_output
     )
+
+
+@pytest.mark.parametrize("json_loads", json_loads_params)
+def test_tailscale_status_json_to_ansible_inventory(
+    json_loads: Callable[[bytes], Any],
+) -> None:
+    """
+    We test that fake tailscale output parsed from raw JSON bytes, as it would be read
+    from the tailscale command, produces the same ansible inventory structure with each
+    of the supported JSON parsers
+    """
+
+    ts_status = json_loads(json.dumps(mock_tailscale_status_output).encode())
+    assert (
+        tailscale_status_to_ansible_inventory(ts_status)
+        == expected_ansible_inventory_output
+    )
+
+
+@pytest.mark.parametrize("json_loads", json_loads_params)
+def test_tailscale_status_json_without_peers_to_ansible_inventory(
+    json_loads: Callable[[bytes], Any],
+) -> None:
+    """
+    We test that tailscale output with a null Peer, as reported when there are no other
+    nodes in the tailnet, produces an inventory of just the self host
+    """
+
+    ts_status_json = json.dumps({**mock_tailscale_status_output, "Peer": None})
+    ts_status = json_loads(ts_status_json.encode())
+    ansible_inventory = tailscale_status_to_ansible_inventory(ts_status)
+    assert ansible_inventory["all"] == {"hosts": ["macclient"]}
+    assert ansible_inventory["self"] == {"hosts": ["macclient"]}
+    assert list(ansible_inventory["_meta"]["hostvars"]) == ["macclient"]
+
+
+@pytest.mark.parametrize("dump_ansible_inventory", dump_ansible_inventory_params)
+def test_dump_ansible_inventory(dump_ansible_inventory: Callable[..., bytes]) -> None:
+    """
+    We test that each supported serializer writes the same compact and pretty JSON,
+    including for non-ASCII hostnames and tags
+    """
+
+    ansible_inventory: ansible_inventory_type = {
+        "_meta": {"hostvars": {"h\u00f4te": {"tailscale_ips": ["100.100.100.100"]}}},
+        "tag_caf\u00e9": {"hosts": ["h\u00f4te"]},
+        "all": {"hosts": ["h\u00f4te"]},
+    }
+
+    assert (
+        dump_ansible_inventory(ansible_inventory)
+        == (
+            '{"_meta":{"hostvars":{"h\u00f4te":{"tailscale_ips":["100.100.100.100"]}}},'
+            '"tag_caf\u00e9":{"hosts":["h\u00f4te"]},"all":{"hosts":["h\u00f4te"]}}'
+        ).encode()
+    )
+    assert (
+        dump_ansible_inventory(ansible_inventory, pretty=True)
+        == (
+            "{\n"
+            '  "_meta": {\n'
+            '    "hostvars": {\n'
+            '      "h\u00f4te": {\n'
+            '        "tailscale_ips": [\n'
+            '          "100.100.100.100"\n'
+            "        ]\n"
+            "      }\n"
+            "    }\n"
+            "  },\n"
+            '  "all": {\n'
+            '    "hosts": [\n'
+            '      "h\u00f4te"\n'
+            "    ]\n"
+            "  },\n"
+            '  "tag_caf\u00e9": {\n'
+            '    "hosts": [\n'
+            '      "h\u00f4te"\n'
+            "    ]\n"
+            "  }\n"
+            "}"
+        ).encode()
+    )
+
+
+def test_inventory_cache(tmp_path: Path) -> None:
+    """
+    We test that a written inventory cache is read back while it is fresh, and ignored
+    when it is missing, expired, modified in the future or caching is disabled
+    """
+
+    cache_path = tmp_path / "cache" / "ansible-tailscale-inventory.json"
+    assert read_inventory_cache(cache_path, 5) is None
+
+    write_inventory_cache(cache_path, b"{}\n")
+    assert read_inventory_cache(cache_path, 5) == b"{}\n"
+    assert read_inventory_cache(cache_path, 0) is None
+    assert list(cache_path.parent.iterdir()) == [cache_path]
+
+    expired_mtime = time.time() - 10
+    os.utime(cache_path, (expired_mtime, expired_mtime))
+    assert read_inventory_cache(cache_path, 5) is None
+
+    future_mtime = time.time() + 10
+    os.utime(cache_path, (future_mtime, future_mtime))
+    assert read_inventory_cache(cache_path, 5) is None
+
+
+@pytest.fixture
+def main_cache_path(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Path:
+    """
+    Sets up main() to build the inventory from mock data with its cache in a temporary
+    directory, returning the path the inventory is cached at
+    """
+
+    def get_tailscale_status() -> TailscaleStatusType:
+        return mock_tailscale_status_output
+
+    monkeypatch.setattr(
+        ansible_tailscale_inventory, "get_tailscale_status", get_tailscale_status
+    )
+    monkeypatch.setattr(sys, "argv", ["ansible_tailscale_inventory.py", "--list"])
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.delenv("TAILSCALE_INV_TTL", raising=False)
+    monkeypatch.delenv("TAILSCALE_INV_PRETTY", raising=False)
+    return tmp_path / "ansible-tailscale-inventory.json"
+
+
+def test_main_compact_output_is_cached(
+    main_cache_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsysbinary: pytest.CaptureFixture[bytes],
+) -> None:
+    """
+    We test that main() prints the inventory as compact JSON, caches it, and prints the
+    cached inventory without running tailscale while the cache is fresh
+    """
+
+    main()
+    inventory_json = capsysbinary.readouterr().out
+    assert json.loads(inventory_json) == expected_ansible_inventory_output
+    assert inventory_json.count(b"\n") == 1
+    assert inventory_json.endswith(b"\n")
+    assert main_cache_path.read_bytes() == inventory_json
+
+    def get_tailscale_status() -> TailscaleStatusType:
+        pytest.fail("tailscale should not run while the cache is fresh")
+
+    monkeypatch.setattr(
+        ansible_tailscale_inventory, "get_tailscale_status", get_tailscale_status
+    )
+    main()
+    assert capsysbinary.readouterr().out == inventory_json
+
+
+@pytest.mark.parametrize(
+    ("argv", "env"),
+    [
+        pytest.param(["--pretty"], {}, id="flag"),
+        pytest.param([], {"TAILSCALE_INV_PRETTY": "1"}, id="env"),
+    ],
+)
+def test_main_pretty_output_skips_cache(
+    main_cache_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsysbinary: pytest.CaptureFixture[bytes],
+    argv: list[str],
+    env: dict[str, str],
+) -> None:
+    """
+    We test that main() prints indented JSON with sorted keys when pretty output is
+    requested, and neither reads nor writes the cache
+    """
+
+    write_inventory_cache(main_cache_path, b"{}\n")
+    monkeypatch.setattr(sys, "argv", ["ansible_tailscale_inventory.py", *argv])
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+
+    main()
+    assert capsysbinary.readouterr().out == (
+        json.dumps(
+            expected_ansible_inventory_output,
+            ensure_ascii=False,
+            indent=2,
+            sort_keys=True,
+        ).encode()
+        + b"\n"
+    )
+    assert main_cache_path.read_bytes() == b"{}\n"
+
+
+def test_main_invalid_cache_ttl(
+    main_cache_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsysbinary: pytest.CaptureFixture[bytes],
+) -> None:
+    """
+    We test that main() exits with an error for a TAILSCALE_INV_TTL that isn't a
+    number of seconds
+    """
+
+    monkeypatch.setenv("TAILSCALE_INV_TTL", "soon")
+    with pytest.raises(SystemExit) as exit_info:
+        main()
+    assert exit_info.value.code == 1
+    assert b"TAILSCALE_INV_TTL" in capsysbinary.readouterr().out
+    assert not main_cache_path.exists()